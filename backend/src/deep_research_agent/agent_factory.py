@@ -1,19 +1,61 @@
 from __future__ import annotations
 
-import hashlib
-import json
+import logging
 import sqlite3
-import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Any
 
+import httpx
+import orjson
 from deepagents import create_deep_agent
 from deepagents.backends import CompositeBackend, FilesystemBackend, StateBackend
 from langgraph.checkpoint.sqlite import SqliteSaver
 
+from .artifacts import (
+    load_cached_source,
+    now_iso_utc,
+    store_cached_source,
+    url_hash,
+    write_source,
+)
 from .model import create_chat_model
 from .settings import Settings
-from .tools import fetch_document
+from .tools import create_http_client, fetch_document, normalize_url
+
+log = logging.getLogger("deep_research_agent.agent_factory")
+
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA wal_autocheckpoint=0",
+)
+
+WAL_CHECKPOINT_INTERVAL_S = 30.0
+AGENT_CACHE_SIZE = 256
+
+_SYSTEM_PROMPT = """You must create these files in {run_dir}:
+- plan.md
+- notes.md
+- sources.json
+- report.md
+
+Rules:
+- Use only information from fetched sources.
+- Call fetch_many(urls) once with all provided URLs.
+- Use fetch_and_store(url) only for a single additional URL.
+- notes.md must include source_id labels S1, S2...
+- sources.json must be valid JSON.
+- report.md must cite sources like [S1].
+- If sources are insufficient, write report.md explaining that and cite [S1].
+
+Output only after all files are written."""
 
 
 @dataclass(frozen=True)
@@ -23,14 +65,104 @@ class ResearchLimits:
     follow_links: bool = False
 
 
+class AgentBusyError(RuntimeError):
+    """Raised when a thread already has a run in progress."""
+
+
+class _CachedAgent:
+    """
+    Compiled agent reused across runs of one (thread_id, limits).
+    Only invoke() is exposed: one run at a time, each starting with an empty
+    seen_urls budget. A second concurrent run is refused rather than queued, so it
+    never parks a worker thread waiting for the first.
+    """
+
+    def __init__(self, agent: Any, seen_urls: set[str]):
+        self._agent = agent
+        self._seen_urls = seen_urls
+        self._run_lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._run_lock.locked()
+
+    def invoke(self, *args: Any, **kwargs: Any) -> Any:
+        if not self._run_lock.acquire(blocking=False):
+            raise AgentBusyError("a run is already in progress for this thread")
+        try:
+            self._seen_urls.clear()
+            return self._agent.invoke(*args, **kwargs)
+        finally:
+            self._run_lock.release()
+
+
 class AgentService:
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, *, http_client: httpx.Client | None = None):
         self.settings = settings
+        self._http = http_client or create_http_client(timeout_s=settings.http_timeout_s)
         self.settings.runs_dir.mkdir(parents=True, exist_ok=True)
         db_path = self.settings.runs_dir / "checkpoints.sqlite"
         conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        for pragma in _SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        conn.commit()
+        self._conn = conn
         self._checkpointer = SqliteSaver(conn)
 
+        self._stop = threading.Event()
+        self._wal_thread = threading.Thread(
+            target=self._wal_checkpoint_loop,
+            args=(db_path,),
+            name="wal-checkpoint",
+            daemon=True,
+        )
+        self._wal_thread.start()
+
+        self._lock = threading.Lock()
+        self._model: Any = None
+        # (thread_id, limits) -> compiled agent, LRU
+        self._agents: OrderedDict[tuple[str, ResearchLimits], _CachedAgent] = OrderedDict()
+
+    def _chat_model(self) -> Any:
+        with self._lock:
+            if self._model is None:
+                self._model = create_chat_model(self.settings)
+            return self._model
+
+    def _wal_checkpoint_loop(self, db_path) -> None:
+        # Own connection so a checkpoint never runs inside a saver transaction.
+        conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        try:
+            conn.execute("PRAGMA busy_timeout=5000")
+            while not self._stop.wait(WAL_CHECKPOINT_INTERVAL_S):
+                try:
+                    busy, wal_pages, checkpointed = conn.execute(
+                        "PRAGMA wal_checkpoint(PASSIVE)"
+                    ).fetchone()
+                    log.debug(
+                        "wal_checkpoint busy=%s log=%s checkpointed=%s",
+                        busy,
+                        wal_pages,
+                        checkpointed,
+                    )
+                except Exception:
+                    log.exception("wal_checkpoint failed")
+        finally:
+            conn.close()
+
+    def close(self) -> None:
+        """Stop the checkpoint thread, fold the WAL back into the db and close it."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wal_thread.join()
+        try:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception:
+            log.exception("final wal_checkpoint failed")
+        finally:
+            self._conn.close()
+
     def _backend(self, rt):
         return CompositeBackend(
             default=StateBackend(rt),
@@ -60,6 +192,14 @@ class AgentService:
             follow_links=follow_links,
         )
 
+        key = (thread_id, limits)
+        with self._lock:
+            cached = self._agents.get(key)
+            if cached is not None:
+                self._agents.move_to_end(key)
+        if cached is not None:
+            return cached
+
         run_dir = f"/runs/{thread_id}"
         thread_dir = (self.settings.runs_dir / thread_id).resolve()
         sources_dir = (thread_dir / "sources").resolve()
@@ -67,32 +207,43 @@ class AgentService:
 
         seen_urls: set[str] = set()
 
-        def _now_iso_utc() -> str:
-            return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-
-        def _sha1(s: str) -> str:
-            return hashlib.sha1(s.encode("utf-8")).hexdigest()
-
         def fetch_and_store(url: str) -> str:
             """Fetch a URL, store extracted text to runs/<thread_id>/sources, return compact JSON metadata."""
-            if url not in seen_urls and len(seen_urls) >= limits.max_sources:
-                return json.dumps({"ok": False, "error": "source limit reached", "url": url})
+            key = normalize_url(url)
+            if key is None:
+                err = {"ok": False, "error": "only http(s) urls allowed", "url": url}
+                return orjson.dumps(err).decode()
+            if key not in seen_urls and len(seen_urls) >= limits.max_sources:
+                err = {"ok": False, "error": "source limit reached", "url": url}
+                return orjson.dumps(err).decode()
 
-            url_hash = _sha1(url)
-            txt_path = sources_dir / f"{url_hash}.txt"
-            meta_path = sources_dir / f"{url_hash}.json"
+            h = url_hash(key)
+            txt_path = sources_dir / f"{h}.txt"
+            meta_path = sources_dir / f"{h}.json"
 
             if meta_path.exists() and txt_path.exists():
                 try:
-                    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                    meta = orjson.loads(meta_path.read_bytes())
                     wc = int(meta.get("word_count") or 0)
                     cc = int(meta.get("char_count") or 0)
                     if meta.get("ok") is True and wc >= 160 and cc >= 1200:
-                        seen_urls.add(url)
-                        return json.dumps(meta, ensure_ascii=False)
+                        seen_urls.add(key)
+                        return orjson.dumps(meta).decode()
                 except Exception:
                     pass
 
+            local_path = f"runs/{thread_id}/sources/{h}.txt"
+            cached = load_cached_source(
+                self.settings.runs_dir,
+                sources_dir,
+                h,
+                local_path=local_path,
+                ttl_s=self.settings.cache_ttl_s,
+            )
+            if cached is not None:
+                seen_urls.add(key)
+                return orjson.dumps(cached).decode()
+
             try:
                 fr = fetch_document(
                     url,
@@ -100,11 +251,11 @@ class AgentService:
                     max_chars=self.settings.max_page_chars,
                     min_words=160,
                     min_chars=1200,
+                    client=self._http,
                 )
             except Exception as e:
-                return json.dumps({"ok": False, "error": f"{type(e).__name__}: {e}", "url": url})
-
-            txt_path.write_text(fr.extracted_text, encoding="utf-8")
+                err = {"ok": False, "error": f"{type(e).__name__}: {e}", "url": url}
+                return orjson.dumps(err).decode()
 
             meta: dict[str, Any] = {
                 "ok": fr.ok,
@@ -114,38 +265,81 @@ class AgentService:
                 "content_type": fr.content_type,
                 "status_code": fr.status_code,
                 "truncated": fr.truncated,
-                "fetched_at": _now_iso_utc(),
-                "local_path": f"runs/{thread_id}/sources/{url_hash}.txt",
+                "fetched_at": now_iso_utc(),
+                "local_path": local_path,
                 "strategy": fr.strategy,
                 "word_count": fr.word_count,
                 "char_count": fr.char_count,
             }
 
-            meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
-            seen_urls.add(url)
-            return json.dumps(meta, ensure_ascii=False)
+            if fr.ok and fr.word_count >= 160 and fr.char_count >= 1200:
+                store_cached_source(
+                    self.settings.runs_dir, sources_dir, h, fr.extracted_text, meta
+                )
+            else:
+                write_source(sources_dir, h, fr.extracted_text, meta)
+            seen_urls.add(key)
+            return orjson.dumps(meta).decode()
+
+        def fetch_many(urls: list[str]) -> str:
+            """
+            Fetch several URLs concurrently like fetch_and_store.
+            Returns a JSON list of metadata in input order.
+            """
+            wanted = list(dict.fromkeys(u.strip() for u in urls if u and u.strip()))
+            results: dict[str, str] = {}
+            first_by_key: dict[str, str] = {}
+            pending: list[str] = []
+            for u in wanted:
+                key = normalize_url(u)
+                if key is None or key in seen_urls:
+                    # Rejected or already fetched this run: no network round-trip needed.
+                    results[u] = fetch_and_store(u)
+                elif key not in first_by_key:
+                    first_by_key[key] = u
+                    pending.append(u)
 
-        system_prompt = f"""You must create these files in {run_dir}:
-- plan.md
-- notes.md
-- sources.json
-- report.md
+            # Like the serial path, only fetches that land in seen_urls spend budget,
+            # so failures in one wave free their slots for the next.
+            while pending:
+                budget = limits.max_sources - len(seen_urls)
+                if budget <= 0:
+                    break
+                batch, pending = pending[:budget], pending[budget:]
+                with ThreadPoolExecutor(max_workers=len(batch)) as pool:
+                    results.update(zip(batch, pool.map(fetch_and_store, batch), strict=True))
 
-Rules:
-- Use only information from fetched sources.
-- For each provided URL, call fetch_and_store(url).
-- notes.md must include source_id labels S1, S2...
-- sources.json must be valid JSON.
-- report.md must cite sources like [S1].
-- If sources are insufficient, write report.md explaining that and cite [S1].
+            out: list[str] = []
+            for u in wanted:
+                r = results.get(u)
+                if r is None:
+                    first = first_by_key.get(normalize_url(u) or "")
+                    r = results.get(first) if first else None
+                if r is None:
+                    err = {"ok": False, "error": "source limit reached", "url": u}
+                    r = orjson.dumps(err).decode()
+                out.append(r)
+            return "[" + ",".join(out) + "]"
 
-Output only after all files are written."""
+        system_prompt = _SYSTEM_PROMPT.replace("{run_dir}", run_dir)
 
         agent = create_deep_agent(
-            model=create_chat_model(self.settings),
-            tools=[fetch_and_store],
+            model=self._chat_model(),
+            tools=[fetch_many, fetch_and_store],
             system_prompt=system_prompt,
             backend=self._backend,
             checkpointer=self._checkpointer,
         )
-        return agent
\ No newline at end of file
+
+        cached = _CachedAgent(agent, seen_urls)
+        with self._lock:
+            # A concurrent build may have won the race; keep its instance so runs share one lock.
+            cached = self._agents.setdefault(key, cached)
+            self._agents.move_to_end(key)
+            # Never evict a running agent: a rebuilt copy would run beside it under a new lock.
+            excess = len(self._agents) - AGENT_CACHE_SIZE
+            if excess > 0:
+                idle = [k for k, a in self._agents.items() if k != key and not a.busy]
+                for k in idle[:excess]:
+                    del self._agents[k]
+        return cached
\ No newline at end of file
@@ -1,21 +1,33 @@
 from __future__ import annotations
 
-import hashlib
-import json
 import logging
+import stat
 import uuid
+from contextlib import asynccontextmanager
 from typing import Any
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+import httpx
+import orjson
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel, Field
-
-from .agent_factory import AgentService
-from .artifacts import artifact_abs_path, ensure_required_artifacts, ensure_thread_dir, list_artifacts
+from starlette.concurrency import run_in_threadpool
+
+from .agent_factory import AgentBusyError, AgentService
+from .artifacts import (
+    artifact_abs_path,
+    ensure_required_artifacts,
+    ensure_thread_dir,
+    list_artifacts,
+    load_cached_source,
+    store_cached_source,
+    url_hash,
+    write_source,
+)
 from .logging_config import configure_logging
 from .model import create_chat_model
-from .settings import Settings
-from .tools import fetch_document
+from .settings import Settings, get_settings
+from .tools import create_http_client, fetch_document, normalize_url, truncate_text
 
 
 log = logging.getLogger("deep_research_agent.api")
@@ -31,10 +43,6 @@ class RunRequest(BaseModel):
     follow_links: bool = False
 
 
-def _sha1(s: str) -> str:
-    return hashlib.sha1(s.encode("utf-8")).hexdigest()
-
-
 def _safe_local_rel(local_path: str) -> str | None:
     if not local_path:
         return None
@@ -48,6 +56,16 @@ def _safe_local_rel(local_path: str) -> str | None:
     return rel
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison (RFC 9110 13.1.2): W/ prefixes are ignored on both sides.
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tag = etag.removeprefix("W/")
+    return any(c.strip().removeprefix("W/") == tag for c in if_none_match.split(","))
+
+
 def _read_text(path, *, max_chars: int) -> str:
     try:
         if not path.exists() or path.is_dir():
@@ -55,20 +73,25 @@ def _read_text(path, *, max_chars: int) -> str:
         s = path.read_text(encoding="utf-8", errors="ignore").strip()
         if not s:
             return ""
-        if len(s) > max_chars:
-            s = s[:max_chars] + "\n\n[TRUNCATED]\n"
-        return s
+        return truncate_text(s, max_chars)[0]
     except Exception:
         return ""
 
 
-def _prefetch_sources(settings: Settings, td, thread_id: str, urls: list[str]) -> list[dict[str, Any]]:
+def _prefetch_sources(
+    settings: Settings,
+    td,
+    thread_id: str,
+    urls: list[str],
+    *,
+    client: httpx.Client | None = None,
+) -> list[dict[str, Any]]:
     sources_dir = (td / "sources").resolve()
     sources_dir.mkdir(parents=True, exist_ok=True)
 
     out: list[dict[str, Any]] = []
     for u in urls:
-        h = _sha1(u)
+        h = url_hash(normalize_url(u) or u)
         txt_path = sources_dir / f"{h}.txt"
         meta_path = sources_dir / f"{h}.json"
 
@@ -76,12 +99,23 @@ def _prefetch_sources(settings: Settings, td, thread_id: str, urls: list[str]) -
         if txt_path.exists() and meta_path.exists():
             try:
                 size_ok = int(txt_path.stat().st_size) >= 1200
-                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                meta = orjson.loads(meta_path.read_bytes())
                 if size_ok and meta.get("ok") is True and meta.get("url") == u:
                     need = False
             except Exception:
                 need = True
 
+        local_path = f"runs/{thread_id}/sources/{h}.txt"
+        if need:
+            cached = load_cached_source(
+                settings.runs_dir,
+                sources_dir,
+                h,
+                local_path=local_path,
+                ttl_s=settings.cache_ttl_s,
+            )
+            need = cached is None
+
         if need:
             try:
                 fr = fetch_document(
@@ -90,8 +124,8 @@ def _prefetch_sources(settings: Settings, td, thread_id: str, urls: list[str]) -
                     max_chars=settings.max_page_chars,
                     min_words=160,
                     min_chars=1200,
+                    client=client,
                 )
-                txt_path.write_text(fr.extracted_text, encoding="utf-8")
                 meta = {
                     "ok": True,
                     "url": fr.url,
@@ -100,35 +134,36 @@ def _prefetch_sources(settings: Settings, td, thread_id: str, urls: list[str]) -
                     "content_type": fr.content_type,
                     "status_code": fr.status_code,
                     "truncated": fr.truncated,
-                    "local_path": f"runs/{thread_id}/sources/{h}.txt",
+                    "local_path": local_path,
                     "strategy": fr.strategy,
                     "word_count": fr.word_count,
                     "char_count": fr.char_count,
                 }
-                meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+                if fr.ok and fr.word_count >= 160 and fr.char_count >= 1200:
+                    store_cached_source(settings.runs_dir, sources_dir, h, fr.extracted_text, meta)
+                else:
+                    write_source(sources_dir, h, fr.extracted_text, meta)
             except Exception as e:
-                try:
-                    txt_path.write_text(f"Fetch failed: {type(e).__name__}: {e}\nURL: {u}\n", encoding="utf-8")
-                except Exception:
-                    pass
                 meta = {
                     "ok": False,
                     "url": u,
                     "error": f"{type(e).__name__}: {e}",
-                    "local_path": f"runs/{thread_id}/sources/{h}.txt",
+                    "local_path": local_path,
                     "strategy": "error",
                     "word_count": 0,
                     "char_count": 0,
                 }
                 try:
-                    meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+                    write_source(
+                        sources_dir, h, f"Fetch failed: {type(e).__name__}: {e}\nURL: {u}\n", meta
+                    )
                 except Exception:
                     pass
 
         try:
-            out.append(json.loads(meta_path.read_text(encoding="utf-8")))
+            out.append(orjson.loads(meta_path.read_bytes()))
         except Exception:
-            out.append({"ok": False, "url": u, "local_path": f"runs/{thread_id}/sources/{h}.txt", "strategy": "error"})
+            out.append({"ok": False, "url": u, "local_path": local_path, "strategy": "error"})
     return out
 
 
@@ -155,19 +190,19 @@ def _ensure_report_with_model(settings: Settings, td, question: str, sources_met
 
     usable = [m for m in sources_meta if isinstance(m, dict) and m.get("ok") is True and isinstance(m.get("local_path"), str)]
     if not usable:
-        report_path.write_text(_build_deterministic_report(td), encoding="utf-8")
+        report_path.write_bytes(_build_deterministic_report(td).encode("utf-8"))
         return
 
     m = usable[0]
     rel = _safe_local_rel(m["local_path"])
     if not rel:
-        report_path.write_text(_build_deterministic_report(td), encoding="utf-8")
+        report_path.write_bytes(_build_deterministic_report(td).encode("utf-8"))
         return
 
     src_fs = (settings.runs_dir / rel).resolve()
     src_text = _read_text(src_fs, max_chars=8000)
     if not src_text:
-        report_path.write_text(_build_deterministic_report(td), encoding="utf-8")
+        report_path.write_bytes(_build_deterministic_report(td).encode("utf-8"))
         return
 
     notes = _read_text(td / "notes.md", max_chars=2500)
@@ -193,41 +228,51 @@ def _ensure_report_with_model(settings: Settings, td, question: str, sources_met
         msg = model.invoke([{"role": "user", "content": prompt}])
         content = (getattr(msg, "content", "") or "").strip()
         if len(content) >= 200:
-            report_path.write_text(content + "\n", encoding="utf-8")
+            report_path.write_bytes((content + "\n").encode("utf-8"))
             return
     except Exception:
         log.exception("ensure_report_with_model failed")
 
-    report_path.write_text(_build_deterministic_report(td), encoding="utf-8")
+    report_path.write_bytes(_build_deterministic_report(td).encode("utf-8"))
 
 
 def create_app(*, settings: Settings | None = None, service: AgentService | None = None) -> FastAPI:
     configure_logging()
-    settings = settings or Settings.load()
-    service = service or AgentService(settings)
+    settings = settings or get_settings()
+    http_client = create_http_client(timeout_s=settings.http_timeout_s)
+    service = service or AgentService(settings, http_client=http_client)
+
+    @asynccontextmanager
+    async def lifespan(_app: FastAPI):
+        yield
+        service.close()
+        http_client.close()
 
-    app = FastAPI(title="Deep Research Agent")
+    app = FastAPI(title="Deep Research Agent", lifespan=lifespan)
 
     @app.get("/health")
     def health() -> dict[str, Any]:
         return {"ok": True}
 
     @app.post("/run")
-    def run(req: RunRequest) -> dict[str, Any]:
+    async def run(req: RunRequest) -> dict[str, Any]:
         thread_id = req.thread_id or str(uuid.uuid4())
         td = ensure_thread_dir(settings.runs_dir, thread_id)
 
-        urls = [u.strip() for u in req.urls if u and u.strip()]
+        urls = [s for s in (u.strip() for u in req.urls if u) if s]
         urls = urls[: max(0, min(req.max_sources, 3))] if urls else []
 
-        sources_meta = _prefetch_sources(settings, td, thread_id, urls)
+        sources_meta = await run_in_threadpool(
+            _prefetch_sources, settings, td, thread_id, urls, client=http_client
+        )
 
         user_msg = req.question.strip()
         if urls:
-            user_msg += "\n\nSources (call fetch_and_store on these):\n" + "\n".join(f"- {u}" for u in urls)
+            user_msg += "\n\nSources (call fetch_many with these):\n" + "\n".join(map("- {}".format, urls))
         user_msg += "\n\nRules:\n- Use only fetched sources.\n- Do not use outside knowledge.\n- Write all required files."
 
-        agent = service.build_agent(
+        agent = await run_in_threadpool(
+            service.build_agent,
             thread_id,
             max_sources=max(0, min(req.max_sources, 3)),
             max_links_per_source=max(0, min(req.max_links_per_source, 10)),
@@ -235,10 +280,15 @@ def create_app(*, settings: Settings | None = None, service: AgentService | None
         )
 
         try:
-            result = agent.invoke(
+            result = await run_in_threadpool(
+                agent.invoke,
                 {"messages": [{"role": "user", "content": user_msg}]},
                 config={"configurable": {"thread_id": thread_id}},
             )
+        except AgentBusyError as e:
+            raise HTTPException(
+                status_code=409, detail={"error": str(e), "thread_id": thread_id}
+            ) from None
         except Exception as e:
             log.exception("agent.invoke failed")
             warnings = ensure_required_artifacts(settings.runs_dir, thread_id)
@@ -251,7 +301,9 @@ def create_app(*, settings: Settings | None = None, service: AgentService | None
                 },
             )
 
-        _ensure_report_with_model(settings, td, req.question.strip(), sources_meta)
+        await run_in_threadpool(
+            _ensure_report_with_model, settings, td, req.question.strip(), sources_meta
+        )
 
         summary_text = ""
         if isinstance(result, dict) and "messages" in result and result["messages"]:
@@ -273,19 +325,33 @@ def create_app(*, settings: Settings | None = None, service: AgentService | None
 
     @app.get("/threads/{thread_id}/artifacts")
     def artifacts(thread_id: str) -> list[dict[str, Any]]:
-        return [a.__dict__ for a in list_artifacts(settings.runs_dir, thread_id)]
+        try:
+            return [a.__dict__ for a in list_artifacts(settings.runs_dir, thread_id)]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from None
 
     @app.get("/threads/{thread_id}/artifacts/{rel_path:path}")
-    def artifact_download(thread_id: str, rel_path: str):
+    def artifact_download(thread_id: str, rel_path: str, request: Request):
         try:
             ap = artifact_abs_path(settings.runs_dir, thread_id, rel_path)
         except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
+            raise HTTPException(status_code=400, detail=str(e)) from None
 
-        if not ap.exists() or ap.is_dir():
+        try:
+            st = ap.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            raise HTTPException(status_code=404, detail="Not found") from None
+        if stat.S_ISDIR(st.st_mode):
             raise HTTPException(status_code=404, detail="Not found")
 
-        return FileResponse(str(ap))
+        resp = FileResponse(str(ap), stat_result=st)
+        etag = resp.headers["etag"]
+        if _etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(
+                status_code=304,
+                headers={"etag": etag, "last-modified": resp.headers["last-modified"]},
+            )
+        return resp
 
     return app
 
@@ -1,12 +1,18 @@
 from __future__ import annotations
 
-import json
+import functools
+import hashlib
+from collections import OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Any, List
 import os
+import shutil
+import threading
 import time
 
+import orjson
+
 
 @dataclass
 class Artifact:
@@ -16,49 +22,229 @@ class Artifact:
 
 
 REQUIRED_FILES = ("plan.md", "notes.md", "sources.json", "report.md")
+SOURCE_CACHE_DIR = "_cache"
+
+THREAD_DIR_CACHE_SIZE = 1024
+
+# (runs_dir, thread_id) -> resolved thread dir already created by this process (LRU)
+_known_thread_dirs: OrderedDict[tuple[str, str], Path] = OrderedDict()
+_known_thread_dirs_lock = threading.Lock()
+
+VALID_SOURCES_CACHE_SIZE = 1024
+
+# sources.json path -> (mtime_ns, size) of the last copy that parsed (LRU)
+_valid_sources: OrderedDict[str, tuple[int, int]] = OrderedDict()
+_valid_sources_lock = threading.Lock()
 
 
 def safe_thread_id(thread_id: str) -> str:
     if not thread_id or "/" in thread_id or "\\" in thread_id or ".." in thread_id:
         raise ValueError("Invalid thread_id")
+    # "_"-prefixed names under runs_dir are reserved (e.g. the shared source cache).
+    if thread_id.startswith("_"):
+        raise ValueError("Invalid thread_id")
     return thread_id
 
 
-def ensure_thread_dir(runs_dir: Path, thread_id: str) -> Path:
+@functools.lru_cache(maxsize=4096)
+def url_hash(url: str) -> str:
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def ensure_thread_dir(runs_dir: Path, thread_id: str, *, refresh: bool = False) -> Path:
+    """
+    Create the thread dir once per process and memoize it.
+    refresh=True re-creates it, for callers that found it deleted underneath the memo.
+    """
+    key = (str(runs_dir), thread_id)
+    if not refresh:
+        with _known_thread_dirs_lock:
+            td = _known_thread_dirs.get(key)
+            if td is not None:
+                _known_thread_dirs.move_to_end(key)
+                return td
     safe_thread_id(thread_id)
-    runs_dir.mkdir(parents=True, exist_ok=True)
     td = (runs_dir / thread_id).resolve()
     td.mkdir(parents=True, exist_ok=True)
+    with _known_thread_dirs_lock:
+        _known_thread_dirs[key] = td
+        _known_thread_dirs.move_to_end(key)
+        while len(_known_thread_dirs) > THREAD_DIR_CACHE_SIZE:
+            _known_thread_dirs.popitem(last=False)
     return td
 
 
-def list_artifacts(runs_dir: Path, thread_id: str) -> List[Artifact]:
-    td = ensure_thread_dir(runs_dir, thread_id)
-    out: List[Artifact] = []
-    for p in td.rglob("*"):
-        if p.is_dir():
-            continue
-        out.append(
-            Artifact(
-                path=str(p.relative_to(td)).replace(os.sep, "/"),
-                size_bytes=p.stat().st_size,
-                mtime_epoch=p.stat().st_mtime,
+def _is_tmp_name(name: str) -> bool:
+    # In-flight _write_replace/_link_or_copy siblings (see _tmp_sibling).
+    return name.startswith(".") and name.endswith(".tmp")
+
+
+def _walk_artifacts(d: str, prefix_len: int, out: list[Artifact]) -> None:
+    with os.scandir(d) as it:
+        for e in it:
+            if _is_tmp_name(e.name):
+                continue
+            try:
+                if e.is_dir(follow_symlinks=False):
+                    _walk_artifacts(e.path, prefix_len, out)
+                    continue
+                st = e.stat()
+            except FileNotFoundError:
+                # Removed mid-walk, or a dangling symlink.
+                continue
+            out.append(
+                Artifact(
+                    path=e.path[prefix_len:].replace(os.sep, "/"),
+                    size_bytes=st.st_size,
+                    mtime_epoch=st.st_mtime,
+                )
             )
-        )
+
+
+def list_artifacts(runs_dir: Path, thread_id: str) -> List[Artifact]:
+    td = str(ensure_thread_dir(runs_dir, thread_id))
+    out: list[Artifact] = []
+    try:
+        _walk_artifacts(td, len(td) + 1, out)
+    except FileNotFoundError:
+        # Only the thread dir itself can raise here; it was deleted behind the memo.
+        ensure_thread_dir(runs_dir, thread_id, refresh=True)
+        return []
     out.sort(key=lambda a: a.path)
     return out
 
 
 def artifact_abs_path(runs_dir: Path, thread_id: str, rel_path: str) -> Path:
     td = ensure_thread_dir(runs_dir, thread_id)
-    if rel_path.startswith("/") or ".." in rel_path or "\\" in rel_path:
+    if rel_path.startswith("/") or ".." in rel_path or "\\" in rel_path or "\x00" in rel_path:
         raise ValueError("Invalid path")
+    # resolve() is still needed to catch symlinks that point outside the thread dir
     ap = (td / rel_path).resolve()
-    if not str(ap).startswith(str(td)):
+    if not ap.is_relative_to(td):
         raise ValueError("Invalid path")
     return ap
 
 
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+
+def _tmp_sibling(path: Path) -> Path:
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _unlink_quiet(path: Path) -> None:
+    # Drop a half-written tmp so artifact walks never list it.
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _write_replace(path: Path, data: bytes) -> None:
+    # New inode each time so hardlinked copies in thread dirs never change underneath,
+    # and readers only ever see a complete file.
+    tmp = _tmp_sibling(path)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view) :]
+            _fdatasync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)
+    except BaseException:
+        _unlink_quiet(tmp)
+        raise
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    tmp = _tmp_sibling(dst)
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        _unlink_quiet(tmp)
+        raise
+
+
+def load_cached_source(
+    runs_dir: Path,
+    sources_dir: Path,
+    h: str,
+    *,
+    local_path: str,
+    ttl_s: float,
+) -> dict[str, Any] | None:
+    """
+    Link a fresh shared-cache entry for h into sources_dir.
+    Returns its metadata with local_path rewritten, or None on a miss.
+    """
+    cd = runs_dir / SOURCE_CACHE_DIR
+    cache_txt = cd / f"{h}.txt"
+    cache_meta = cd / f"{h}.json"
+    try:
+        if time.time() - cache_meta.stat().st_mtime >= ttl_s:
+            return None
+        meta = orjson.loads(cache_meta.read_bytes())
+        _link_or_copy(cache_txt, sources_dir / f"{h}.txt")
+    except (OSError, ValueError):
+        return None
+    meta["local_path"] = local_path
+    _write_replace(sources_dir / f"{h}.json", orjson.dumps(meta))
+    return meta
+
+
+def write_source(sources_dir: Path, h: str, text: str, meta: dict[str, Any]) -> None:
+    """
+    Write a thread-local source pair without touching shared-cache inodes.
+    The .json lands last, so its presence implies a complete .txt.
+    """
+    _write_replace(sources_dir / f"{h}.txt", text.encode("utf-8"))
+    _write_replace(sources_dir / f"{h}.json", orjson.dumps(meta))
+
+
+def store_cached_source(
+    runs_dir: Path,
+    sources_dir: Path,
+    h: str,
+    text: str,
+    meta: dict[str, Any],
+) -> None:
+    """Write a fetched source to the shared cache, then link it into sources_dir."""
+    cd = runs_dir / SOURCE_CACHE_DIR
+    cd.mkdir(parents=True, exist_ok=True)
+    # local_path names the originating thread; load_cached_source fills in the reader's.
+    shared = {k: v for k, v in meta.items() if k != "local_path"}
+    _write_replace(cd / f"{h}.txt", text.encode("utf-8"))
+    _write_replace(cd / f"{h}.json", orjson.dumps(shared))
+    _link_or_copy(cd / f"{h}.txt", sources_dir / f"{h}.txt")
+    _write_replace(sources_dir / f"{h}.json", orjson.dumps(meta))
+
+
+def _sources_json_valid(path: Path) -> bool:
+    try:
+        st = path.stat()
+        key = (st.st_mtime_ns, st.st_size)
+        with _valid_sources_lock:
+            if _valid_sources.get(str(path)) == key:
+                _valid_sources.move_to_end(str(path))
+                return True
+        orjson.loads(path.read_bytes())
+    except Exception:
+        return False
+    with _valid_sources_lock:
+        _valid_sources[str(path)] = key
+        _valid_sources.move_to_end(str(path))
+        while len(_valid_sources) > VALID_SOURCES_CACHE_SIZE:
+            _valid_sources.popitem(last=False)
+    return True
+
+
 def ensure_required_artifacts(runs_dir: Path, thread_id: str) -> list[str]:
     """
     Production-grade: guarantee deliverables exist.
@@ -72,34 +258,39 @@ def ensure_required_artifacts(runs_dir: Path, thread_id: str) -> list[str]:
     sources = td / "sources.json"
     report = td / "report.md"
 
-    if not plan.exists():
-        plan.write_text("# Plan\n\n- (Agent did not write plan)\n", encoding="utf-8")
+    try:
+        with os.scandir(td) as it:
+            present = {e.name for e in it}
+    except FileNotFoundError:
+        ensure_thread_dir(runs_dir, thread_id, refresh=True)
+        present = set()
+
+    if plan.name not in present:
+        plan.write_bytes(b"# Plan\n\n- (Agent did not write plan)\n")
         warnings.append("Backfilled plan.md (agent did not create it).")
 
-    if not notes.exists():
-        notes.write_text("# Notes\n\n(Agent did not write notes)\n", encoding="utf-8")
+    if notes.name not in present:
+        notes.write_bytes(b"# Notes\n\n(Agent did not write notes)\n")
         warnings.append("Backfilled notes.md (agent did not create it).")
 
-    if not sources.exists():
-        sources.write_text("[]\n", encoding="utf-8")
+    if sources.name not in present:
+        sources.write_bytes(b"[]\n")
         warnings.append("Backfilled sources.json (agent did not create it).")
-    else:
+    elif not _sources_json_valid(sources):
         # validate JSON so consumers don’t break
-        try:
-            json.loads(sources.read_text(encoding="utf-8"))
-        except Exception:
-            sources.write_text("[]\n", encoding="utf-8")
-            warnings.append("Reset sources.json to [] (invalid JSON).")
-
-    if not report.exists():
-        report.write_text(
-            "# Report\n\n(Agent did not write report)\n",
-            encoding="utf-8",
-        )
+        sources.write_bytes(b"[]\n")
+        warnings.append("Reset sources.json to [] (invalid JSON).")
+
+    if report.name not in present:
+        report.write_bytes(b"# Report\n\n(Agent did not write report)\n")
         warnings.append("Backfilled report.md (agent did not create it).")
 
     return warnings
 
 
+_ISO_UTC_FMT = "%04d-%02d-%02dT%02d:%02d:%02dZ"
+
+
 def now_iso_utc() -> str:
-    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
\ No newline at end of file
+    t = time.gmtime()
+    return _ISO_UTC_FMT % (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import functools
 import os
 from dataclasses import dataclass
 from pathlib import Path
@@ -68,6 +69,8 @@ class Settings:
     host: str
     port: int
 
+    cache_ttl_s: float = 86400.0
+
     @staticmethod
     def load() -> "Settings":
         model_provider = _env_str("MODEL_PROVIDER", "openai").lower()
@@ -103,4 +106,12 @@ class Settings:
 
             host=_env_str("HOST", "127.0.0.1"),
             port=_env_int("PORT", 8000),
-        )
\ No newline at end of file
+
+            cache_ttl_s=_env_float("CACHE_TTL_S", 86400.0),
+        )
+
+
+@functools.lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Process-wide Settings; call get_settings.cache_clear() after changing the env."""
+    return Settings.load()
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import atexit
+import functools
 import ipaddress
 import io
 import re
@@ -7,117 +9,307 @@ import socket
 from dataclasses import dataclass
 from html.parser import HTMLParser
 from typing import Optional
-from urllib.parse import quote, urljoin, urldefrag, urlparse
+from urllib.parse import quote, urljoin, urldefrag, urlparse, urlsplit, urlunsplit
 
 import httpx
 
+try:
+    from lxml import etree as _etree  # type: ignore
+except Exception:
+    _etree = None
+
 
 class _TextAndLinksParser(HTMLParser):
-    def __init__(self) -> None:
+    def __init__(self, *, collect_text: bool = True, collect_links: bool = True) -> None:
         super().__init__()
+        self._collect_text = collect_text
+        self._collect_links = collect_links
         self._in_script = False
         self._in_style = False
-        self.text_parts: list[str] = []
+        self._buf = io.StringIO()
+        self._sep = ""
         self.links: list[str] = []
 
+    # HTMLParser already lowercases tag and attribute names.
     def handle_starttag(self, tag, attrs):
-        t = (tag or "").lower()
-        if t == "script":
+        if tag == "a":
+            if self._collect_links:
+                for k, v in attrs:
+                    if k == "href" and v:
+                        self.links.append(v)
+        elif tag == "script":
             self._in_script = True
             return
-        if t == "style":
+        elif tag == "style":
             self._in_style = True
             return
-        if t in {"p", "br", "div", "section", "article", "main", "li", "ul", "ol"} or t.startswith("h"):
-            self.text_parts.append("\n")
-        if t == "a":
-            for k, v in attrs:
-                if (k or "").lower() == "href" and v:
-                    self.links.append(v)
+        if self._collect_text and _is_block_start(tag):
+            self._write("\n")
 
     def handle_endtag(self, tag):
-        t = (tag or "").lower()
-        if t == "script":
+        if tag == "script":
             self._in_script = False
-        elif t == "style":
+        elif tag == "style":
             self._in_style = False
-        elif t in {"p", "li"} or t.startswith("h"):
-            self.text_parts.append("\n")
+        elif self._collect_text and _is_block_end(tag):
+            self._write("\n")
 
     def handle_data(self, data):
-        if self._in_script or self._in_style:
+        if not self._collect_text or self._in_script or self._in_style:
             return
         s = (data or "").strip()
         if s:
-            self.text_parts.append(s)
+            self._write(s)
+
+    def _write(self, piece: str) -> None:
+        # Newline-separated, matching the former "\n".join over collected parts.
+        self._buf.write(self._sep)
+        self._buf.write(piece)
+        self._sep = "\n"
+
+    def text(self) -> str:
+        return self._buf.getvalue()
+
+
+_RE_SPACES = re.compile(r"[ \t]{2,}")
+_RE_BLANK_LINES = re.compile(r"\n{3,}")
+_RE_WS = re.compile(r"\s+")
+_RE_TITLE = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+_RE_WORD = re.compile(r"\b\w+\b")
+_RE_NONCONTENT = [
+    re.compile(rf"<{tag}\b[^>]*>.*?</{tag}>", re.IGNORECASE | re.DOTALL)
+    for tag in ("nav", "header", "footer", "aside")
+]
+_RE_CONTENT = [
+    re.compile(rf"<{tag}\b[^>]*>(.*?)</{tag}>", re.IGNORECASE | re.DOTALL)
+    for tag in ("main", "article", "body")
+]
+
+
+TRUNC_MARKER = "\n\n[TRUNCATED]\n"
+
+
+def truncate_text(text: str, max_chars: int) -> tuple[str, bool]:
+    if len(text) <= max_chars:
+        return text, False
+    out = text[:max_chars]
+    out += TRUNC_MARKER
+    return out, True
 
 
 def _normalize_text(text: str) -> str:
-    t = re.sub(r"[ \t]{2,}", " ", text)
-    t = re.sub(r"\n{3,}", "\n\n", t)
+    t = _RE_SPACES.sub(" ", text)
+    if "\n\n\n" in t:
+        t = _RE_BLANK_LINES.sub("\n\n", t)
     return t.strip()
 
 
 def _strip_noncontent_blocks(html: str) -> str:
     t = html
-    for tag in ("nav", "header", "footer", "aside"):
-        t = re.sub(
-            rf"<{tag}\b[^>]*>.*?</{tag}>",
-            "",
-            t,
-            flags=re.IGNORECASE | re.DOTALL,
-        )
+    for rx in _RE_NONCONTENT:
+        t = rx.sub("", t)
     return t
 
 
 def _select_content_html(html: str) -> str:
     h = _strip_noncontent_blocks(html)
-    for tag in ("main", "article", "body"):
-        m = re.search(rf"<{tag}\b[^>]*>(.*?)</{tag}>", h, flags=re.IGNORECASE | re.DOTALL)
+    for rx in _RE_CONTENT:
+        m = rx.search(h)
         if m and m.group(1):
             return m.group(1)
     return h
 
 
+@dataclass(frozen=True)
+class ParsedDoc:
+    title: Optional[str]
+    text: str
+    links_raw: tuple[str, ...]
+
+
+_HTTP_PREFIXES = ("http://", "https://")
+
+
+def _resolve_links(hrefs: tuple[str, ...] | list[str], base_url: str, limit: int) -> list[str]:
+    join, defrag = urljoin, urldefrag
+    out: dict[str, None] = {}
+
+    for href in hrefs:
+        abs_url = defrag(join(base_url, href))[0]
+        # urljoin leaves an href with a different scheme untouched, case included.
+        if not abs_url[:8].lower().startswith(_HTTP_PREFIXES):
+            continue
+        out[abs_url] = None
+        if len(out) >= limit:
+            break
+
+    return list(out)
+
+
 def html_to_text(html: str) -> str:
+    return parse_html(html).text
+
+
+def extract_links(html: str, base_url: str, *, limit: int = 50) -> list[str]:
+    return _resolve_links(parse_html(html).links_raw, base_url, limit)
+
+
+def _html_to_text_py(html: str) -> str:
     content_html = _select_content_html(html)
-    parser = _TextAndLinksParser()
+    parser = _TextAndLinksParser(collect_links=False)
     parser.feed(content_html)
-    return _normalize_text("\n".join(parser.text_parts))
+    return _normalize_text(parser.text())
 
 
-def extract_links(html: str, base_url: str, *, limit: int = 50) -> list[str]:
-    parser = _TextAndLinksParser()
+def _extract_links_py(html: str, base_url: str, *, limit: int = 50) -> list[str]:
+    parser = _TextAndLinksParser(collect_text=False)
     parser.feed(html)
+    return _resolve_links(parser.links, base_url, limit)
+
+
+def extract_title(html: str) -> str | None:
+    # Plain find() for the usual lowercase markup; regex only for other casings.
+    raw: str | None = None
+    i = html.find("<title")
+    if i != -1:
+        j = html.find(">", i)
+        if j != -1:
+            k = html.find("</title>", j + 1)
+            if k != -1:
+                raw = html[j + 1 : k]
+    if raw is None:
+        m = _RE_TITLE.search(html)
+        if not m:
+            return None
+        raw = m.group(1)
+    t = _RE_WS.sub(" ", raw).strip()
+    return t or None
 
-    out: list[str] = []
-    seen: set[str] = set()
 
-    for href in parser.links:
-        abs_url = urljoin(base_url, href)
-        abs_url, _ = urldefrag(abs_url)
+_BLOCK_START_TAGS = {"p", "br", "div", "section", "article", "main", "li", "ul", "ol"}
+_BLOCK_END_TAGS = {"p", "li"}
+_SKIP_TAGS = {"script", "style", "nav", "header", "footer", "aside"}
+_CONTENT_TAGS = ("main", "article", "body")
 
-        p = urlparse(abs_url)
-        if p.scheme not in ("http", "https"):
-            continue
 
-        if abs_url in seen:
-            continue
-        seen.add(abs_url)
-        out.append(abs_url)
+def _is_block_start(tag: str) -> bool:
+    return tag in _BLOCK_START_TAGS or tag.startswith("h")
 
-        if len(out) >= limit:
-            break
 
-    return out
+def _is_block_end(tag: str) -> bool:
+    return tag in _BLOCK_END_TAGS or tag.startswith("h")
 
 
-def extract_title(html: str) -> str | None:
-    m = re.search(r"<title[^>]*>(.*?)</title>", html, flags=re.IGNORECASE | re.DOTALL)
-    if not m:
-        return None
-    t = re.sub(r"\s+", " ", m.group(1)).strip()
-    return t or None
+def _parse_html_py(html: str) -> ParsedDoc:
+    parser = _TextAndLinksParser(collect_text=False)
+    parser.feed(html)
+    return ParsedDoc(extract_title(html), _html_to_text_py(html), tuple(parser.links))
+
+
+@functools.lru_cache(maxsize=32)
+def parse_html(html: str) -> ParsedDoc:
+    """
+    Extract title, visible text and raw hrefs in a single streaming lxml pass.
+    Memoized so title/text/link lookups on the same page share one parse.
+    Falls back to the stdlib HTMLParser helpers when lxml is not installed
+    or rejects the input.
+    """
+    if not html.strip():
+        return ParsedDoc(None, "", ())
+    if _etree is None:
+        return _parse_html_py(html)
+
+    pull = _etree.HTMLPullParser(events=("start", "end", "comment", "pi"))
+
+    title: str | None = None
+    hrefs: list[str] = []
+    buckets: dict[str, list[str]] = {"": []}
+    open_content: list[str] = []
+    skip_depth = 0
+    # (element, "text" | "tail") whose text is only complete once the next event arrives
+    pending: tuple[object, str] | None = None
+
+    def emit(piece: str) -> None:
+        buckets[""].append(piece)
+        for tag in open_content:
+            buckets[tag].append(piece)
+
+    def flush() -> None:
+        nonlocal pending
+        if pending is None:
+            return
+        elem, which = pending
+        pending = None
+        # Inside a skipped block both text and tails are dropped; a skip element's own
+        # tail is flushed after its end event has already decremented skip_depth.
+        if skip_depth:
+            return
+        data = getattr(elem, which, None)
+        s = (data or "").strip()
+        if s:
+            emit(s)
+
+    def handle(event: str, elem) -> None:
+        nonlocal pending, skip_depth, title
+        flush()
+        if event in ("comment", "pi"):
+            pending = (elem, "tail")
+            return
+
+        tag = elem.tag.lower() if isinstance(elem.tag, str) else ""
+        if event == "start":
+            if tag in _SKIP_TAGS:
+                skip_depth += 1
+            elif not skip_depth:
+                if tag in _CONTENT_TAGS and tag not in buckets:
+                    buckets[tag] = []
+                    open_content.append(tag)
+                if _is_block_start(tag):
+                    emit("\n")
+            if tag == "a":
+                href = elem.get("href")
+                if href:
+                    hrefs.append(href)
+            pending = (elem, "text")
+            return
+
+        if tag == "title" and title is None:
+            t = _RE_WS.sub(" ", elem.text or "").strip()
+            title = t or None
+        if tag in _SKIP_TAGS:
+            skip_depth -= 1
+        elif not skip_depth:
+            if _is_block_end(tag):
+                emit("\n")
+            if open_content and open_content[-1] == tag:
+                open_content.pop()
+        elem.clear(keep_tail=True)
+        # Top-level elements can have comment/PI siblings but no parent.
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+        pending = (elem, "tail")
+
+    chunk = 65536
+    try:
+        for i in range(0, len(html), chunk):
+            pull.feed(html[i : i + chunk])
+            for event, elem in pull.read_events():
+                handle(event, elem)
+        pull.close()
+        for event, elem in pull.read_events():
+            handle(event, elem)
+    except _etree.XMLSyntaxError:
+        return _parse_html_py(html)
+    flush()
+
+    parts = buckets[""]
+    for tag in _CONTENT_TAGS:
+        if tag in buckets:
+            parts = buckets[tag]
+            break
+    return ParsedDoc(title, _normalize_text("\n".join(parts)), tuple(hrefs))
 
 
 def _is_ip_blocked(ip: ipaddress._BaseAddress) -> bool:
@@ -159,9 +351,25 @@ def _host_is_blocked(host: str) -> bool:
     return False
 
 
+_HTTP_SCHEMES = frozenset({"http", "https"})
+
+
+@functools.lru_cache(maxsize=256)
+def normalize_url(url: str) -> str | None:
+    """Lowercase scheme and host and drop the fragment; None for non-http(s) urls."""
+    try:
+        p = urlsplit(url.strip())
+    except ValueError:
+        return None
+    scheme = p.scheme.lower()
+    if scheme not in _HTTP_SCHEMES:
+        return None
+    return urlunsplit((scheme, p.netloc.lower(), p.path, p.query, ""))
+
+
 def _validate_url(url: str) -> str:
-    p = urlparse(url)
-    if p.scheme not in ("http", "https"):
+    p = urlsplit(url)
+    if p.scheme not in _HTTP_SCHEMES:
         raise ValueError("only http(s) urls allowed")
     if p.username or p.password:
         raise ValueError("userinfo not allowed")
@@ -173,7 +381,7 @@ def _validate_url(url: str) -> str:
 
 
 def _word_count(text: str) -> int:
-    return len(re.findall(r"\b\w+\b", text))
+    return len(_RE_WORD.findall(text))
 
 
 def _jina_reader_url(url: str) -> str:
@@ -203,7 +411,7 @@ def _detect_kind(url: str, content_type: str) -> str:
     return "unknown"
 
 
-def _extract_pdf_text(data: bytes) -> tuple[bool, str]:
+def _extract_pdf_text(data: bytes | bytearray) -> tuple[bool, str]:
     try:
         from pypdf import PdfReader  # type: ignore
     except Exception:
@@ -225,7 +433,7 @@ def _extract_pdf_text(data: bytes) -> tuple[bool, str]:
         return False, f"PDF extraction failed: {type(e).__name__}: {e}"
 
 
-def _extract_docx_text(data: bytes) -> tuple[bool, str]:
+def _extract_docx_text(data: bytes | bytearray) -> tuple[bool, str]:
     try:
         from docx import Document  # type: ignore
     except Exception:
@@ -267,34 +475,83 @@ class FetchResult:
     kind: str
 
 
-def _fetch_bytes(url: str, *, timeout_s: float, max_bytes: int) -> tuple[bytes, str, int, str, bool]:
-    headers = {
-        "User-Agent": "deep-research-agent/0.1",
-        "Accept": "*/*",
-        "Accept-Language": "en-US,en;q=0.9",
-    }
-    limits = httpx.Limits(max_connections=20, max_keepalive_connections=10)
-    transport = httpx.HTTPTransport(retries=0)
-    with httpx.Client(timeout=timeout_s, follow_redirects=True, headers=headers, limits=limits, transport=transport) as client:
-        with client.stream("GET", url) as r:
-            status = int(r.status_code)
-            final_url = str(r.url)
-            ctype = (r.headers.get("content-type") or "").lower()
-            buf = bytearray()
-            truncated = False
-            for chunk in r.iter_bytes():
-                if not chunk:
-                    continue
-                remaining = max_bytes - len(buf)
-                if remaining <= 0:
-                    truncated = True
-                    break
-                if len(chunk) > remaining:
-                    buf.extend(chunk[:remaining])
-                    truncated = True
-                    break
-                buf.extend(chunk)
-            return bytes(buf), final_url, status, ctype, truncated
+_DEFAULT_HEADERS = {
+    "User-Agent": "deep-research-agent/0.1",
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+
+_FETCH_CHUNK_BYTES = 16384
+
+
+def _timeout(timeout_s: float) -> httpx.Timeout:
+    # Fail fast on connect/pool waits; only reads get the full budget.
+    short = min(5.0, timeout_s)
+    return httpx.Timeout(timeout_s, connect=short, write=short, pool=short)
+
+
+def create_http_client(*, timeout_s: float) -> httpx.Client:
+    """Pooled keep-alive HTTP/2 client meant to be shared across fetches."""
+    return httpx.Client(
+        timeout=_timeout(timeout_s),
+        follow_redirects=True,
+        headers=_DEFAULT_HEADERS,
+        # Client(limits=...) is ignored once a transport is given; the pool lives there.
+        transport=httpx.HTTPTransport(
+            retries=0,
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=100, max_keepalive_connections=20, keepalive_expiry=30
+            ),
+        ),
+    )
+
+
+# Fallback for callers that do not pass their own client (fetch_url, scripts).
+# Per-request timeouts are passed to stream(), so the default here is only a backstop.
+_CLIENT = create_http_client(timeout_s=25.0)
+atexit.register(_CLIENT.close)
+
+
+def _fetch_bytes(
+    url: str,
+    *,
+    timeout_s: float,
+    max_bytes: int,
+    client: httpx.Client | None = None,
+) -> tuple[bytearray, str, int, str, bool]:
+    client = client or _CLIENT
+    with client.stream("GET", url, timeout=_timeout(timeout_s)) as r:
+        status = int(r.status_code)
+        final_url = str(r.url)
+        ctype = (r.headers.get("content-type") or "").lower()
+        buf = bytearray()
+        truncated = False
+        for chunk in r.iter_bytes(chunk_size=_FETCH_CHUNK_BYTES):
+            if not chunk:
+                continue
+            remaining = max_bytes - len(buf)
+            if remaining <= 0:
+                truncated = True
+                break
+            if len(chunk) > remaining:
+                buf.extend(chunk[:remaining])
+                truncated = True
+                break
+            buf.extend(chunk)
+        return buf, final_url, status, ctype, truncated
+
+
+def _decode_body(data: bytes | bytearray, ctype: str) -> str:
+    # Decode the already-capped body once, using the header charset and skipping
+    # httpx's content sniffing; unknown, missing or unusable charsets fall back to utf-8.
+    _, found, rest = ctype.partition("charset=")
+    charset = rest.partition(";")[0].strip().strip("\"'") if found else ""
+    try:
+        return data.decode(charset or "utf-8", errors="replace")
+    except (LookupError, UnicodeError):
+        return data.decode("utf-8", errors="replace")
 
 
 def fetch_document(
@@ -304,11 +561,14 @@ def fetch_document(
     max_chars: int = 250_000,
     min_words: int = 160,
     min_chars: int = 1200,
+    client: httpx.Client | None = None,
 ) -> FetchResult:
     url = _validate_url(url)
 
     max_bytes = min(12_000_000, max(128_000, max_chars * 6))
-    data, final_url, status, ctype, truncated_raw = _fetch_bytes(url, timeout_s=timeout_s, max_bytes=max_bytes)
+    data, final_url, status, ctype, truncated_raw = _fetch_bytes(
+        url, timeout_s=timeout_s, max_bytes=max_bytes, client=client
+    )
 
     _validate_url(final_url)
 
@@ -338,17 +598,18 @@ def fetch_document(
     strategy = "direct"
 
     if kind == "html":
-        raw = data.decode("utf-8", errors="replace")
-        title = extract_title(raw)
-        extracted = html_to_text(raw)
-        extracted = _normalize_text(extracted)
+        raw = _decode_body(data, ctype)
+        doc = parse_html(raw)
+        title, extracted = doc.title, doc.text
         wc = _word_count(extracted)
         cc = len(extracted)
         if (wc < min_words or cc < min_chars) or cc == 0:
             jr = _jina_reader_url(final_url)
             try:
-                data2, final_url2, status2, ctype2, truncated2 = _fetch_bytes(jr, timeout_s=timeout_s, max_bytes=max_bytes)
-                text2 = _normalize_text(data2.decode("utf-8", errors="replace"))
+                data2, final_url2, status2, ctype2, truncated2 = _fetch_bytes(
+                    jr, timeout_s=timeout_s, max_bytes=max_bytes, client=client
+                )
+                text2 = _normalize_text(_decode_body(data2, ctype2))
                 wc2 = _word_count(text2)
                 cc2 = len(text2)
                 if status2 >= 200 and status2 < 300 and wc2 >= min_words and cc2 >= min_chars:
@@ -362,10 +623,7 @@ def fetch_document(
             except Exception:
                 pass
 
-        truncated = False
-        if len(extracted) > max_chars:
-            extracted = extracted[:max_chars] + "\n\n[TRUNCATED]\n"
-            truncated = True
+        extracted, truncated = truncate_text(extracted, max_chars)
 
         return FetchResult(
             ok=True,
@@ -383,12 +641,9 @@ def fetch_document(
         )
 
     if kind in {"txt", "md", "csv"}:
-        extracted = data.decode("utf-8", errors="replace")
+        extracted = _decode_body(data, ctype)
         extracted = _normalize_text(extracted)
-        truncated = False
-        if len(extracted) > max_chars:
-            extracted = extracted[:max_chars] + "\n\n[TRUNCATED]\n"
-            truncated = True
+        extracted, truncated = truncate_text(extracted, max_chars)
         return FetchResult(
             ok=True,
             url=url,
@@ -408,10 +663,7 @@ def fetch_document(
         ok2, text = _extract_pdf_text(data)
         ok = bool(ok2)
         extracted = _normalize_text(text)
-        truncated = False
-        if len(extracted) > max_chars:
-            extracted = extracted[:max_chars] + "\n\n[TRUNCATED]\n"
-            truncated = True
+        extracted, truncated = truncate_text(extracted, max_chars)
         return FetchResult(
             ok=ok,
             url=url,
@@ -431,10 +683,7 @@ def fetch_document(
         ok2, text = _extract_docx_text(data)
         ok = bool(ok2)
         extracted = _normalize_text(text)
-        truncated = False
-        if len(extracted) > max_chars:
-            extracted = extracted[:max_chars] + "\n\n[TRUNCATED]\n"
-            truncated = True
+        extracted, truncated = truncate_text(extracted, max_chars)
         return FetchResult(
             ok=ok,
             url=url,
@@ -468,6 +717,8 @@ def fetch_document(
 
 
 def fetch_url(url: str, *, timeout_s: float = 25.0, max_chars: int = 250_000) -> str:
+    if not url[:8].lower().startswith(_HTTP_PREFIXES):
+        return "Blocked: only http(s) urls allowed"
     try:
         fr = fetch_document(url, timeout_s=timeout_s, max_chars=max_chars)
         return fr.extracted_text
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import json
 from pathlib import Path
+from typing import Iterator
 import pytest
 from fastapi.testclient import TestClient
 
@@ -10,6 +11,17 @@ from deep_research_agent.settings import Settings
 from deep_research_agent.artifacts import ensure_thread_dir
 
 
+_ARTIFACT_BYTES = (
+    ("plan.md", b"# Plan\n\n- Step 1\n- Step 2\n"),
+    ("notes.md", b"# Notes\n\n- Note A\n"),
+    (
+        "sources.json",
+        json.dumps([{"url": "https://example.com", "summary": "Example"}], indent=2).encode(),
+    ),
+    ("report.md", b"# Report\n\nThis is a test report.\n"),
+)
+
+
 class FakeAgent:
     def __init__(self, runs_dir: Path, thread_id: str, should_fail: bool = False):
         self.runs_dir = runs_dir
@@ -22,15 +34,9 @@ class FakeAgent:
 
         td = ensure_thread_dir(self.runs_dir, self.thread_id)
 
-        (td / "plan.md").write_text("# Plan\n\n- Step 1\n- Step 2\n", encoding="utf-8")
-        (td / "notes.md").write_text("# Notes\n\n- Note A\n", encoding="utf-8")
-        (td / "sources.json").write_text(
-            json.dumps([{"url": "https://example.com", "summary": "Example"}], indent=2),
-            encoding="utf-8",
-        )
-        (td / "report.md").write_text(
-            "# Report\n\nThis is a test report.\n", encoding="utf-8"
-        )
+        for name, data in _ARTIFACT_BYTES:
+            with open(td / name, "wb") as f:
+                f.write(data)
 
         return {
             "messages": [
@@ -50,19 +56,29 @@ class FakeService:
     def build_agent(self, thread_id: str, *args, **kwargs):
         return FakeAgent(self.runs_dir, thread_id, should_fail=self.should_fail)
 
+    def close(self) -> None:
+        pass
+
 
-@pytest.fixture()
-def test_runs_dir(tmp_path: Path) -> Path:
-    d = tmp_path / "runs"
+@pytest.fixture(scope="session")
+def test_runs_dir(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    d = tmp_path_factory.mktemp("runs")
     d.mkdir(parents=True, exist_ok=True)
     return d
 
 
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def test_settings(test_runs_dir: Path) -> Settings:
     return Settings(
         model_provider="ollama",
         ollama_model="llama3.1",
+        ollama_num_predict=220,
+        openai_base_url="https://api.openai.com/v1",
+        openai_api_key="",
+        openai_model="gpt-5-mini",
+        openai_max_tokens=350,
+        openai_timeout_s=60.0,
+        openai_max_retries=1,
         temperature=0.2,
         runs_dir=test_runs_dir,
         max_page_chars=50_000,
@@ -72,13 +88,15 @@ def test_settings(test_runs_dir: Path) -> Settings:
     )
 
 
-@pytest.fixture()
-def client(test_settings: Settings, test_runs_dir: Path) -> TestClient:
+@pytest.fixture(scope="session")
+def client(test_settings: Settings, test_runs_dir: Path) -> Iterator[TestClient]:
     app = create_app(settings=test_settings, service=FakeService(test_runs_dir))
-    return TestClient(app)
+    with TestClient(app) as c:
+        yield c
 
 
-@pytest.fixture()
-def failing_client(test_settings: Settings, test_runs_dir: Path) -> TestClient:
+@pytest.fixture(scope="session")
+def failing_client(test_settings: Settings, test_runs_dir: Path) -> Iterator[TestClient]:
     app = create_app(settings=test_settings, service=FakeService(test_runs_dir, should_fail=True))
-    return TestClient(app)
\ No newline at end of file
+    with TestClient(app) as c:
+        yield c
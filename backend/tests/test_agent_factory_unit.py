@@ -0,0 +1,156 @@
+import dataclasses
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from deep_research_agent import agent_factory
+from deep_research_agent.agent_factory import AgentBusyError, AgentService
+from deep_research_agent.settings import Settings
+from deep_research_agent.tools import FetchResult
+
+
+def test_close_truncates_wal(test_settings: Settings, tmp_path: Path):
+    settings = dataclasses.replace(test_settings, runs_dir=tmp_path / "runs")
+    service = AgentService(settings)
+    service._conn.execute("CREATE TABLE t (x)")
+    service._conn.commit()
+
+    service.close()
+    service.close()
+
+    assert not service._wal_thread.is_alive()
+    wal = settings.runs_dir / "checkpoints.sqlite-wal"
+    assert not wal.exists() or wal.stat().st_size == 0
+
+
+class _BlockingAgent:
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def invoke(self, *_args, **_kwargs):
+        self.started.set()
+        self.release.wait(5)
+        return {"messages": []}
+
+
+def test_cached_agent_refuses_concurrent_runs_and_stays_cached(
+    test_settings: Settings, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(agent_factory, "create_deep_agent", lambda **_kwargs: _BlockingAgent())
+    monkeypatch.setattr(agent_factory, "AGENT_CACHE_SIZE", 1)
+    monkeypatch.setattr(AgentService, "_chat_model", lambda self: None)
+    service = AgentService(dataclasses.replace(test_settings, runs_dir=tmp_path / "runs"))
+    try:
+        agent = service.build_agent("t1")
+        assert service.build_agent("t1") is agent
+        assert not hasattr(agent, "ainvoke")
+
+        inner = agent._agent
+        run = threading.Thread(target=agent.invoke, args=({},))
+        run.start()
+        assert inner.started.wait(5)
+        with pytest.raises(AgentBusyError):
+            agent.invoke({})
+
+        service.build_agent("t2")
+        assert service.build_agent("t1") is agent
+
+        inner.release.set()
+        run.join()
+        service.build_agent("t3")
+        assert service.build_agent("t1") is not agent
+    finally:
+        service.close()
+
+
+def _fake_fetch(calls: list[str]):
+    def fetch_document(url: str, **_kwargs) -> FetchResult:
+        calls.append(url)
+        if "fail" in url:
+            raise OSError("connection refused")
+        text = "word " * 300
+        return FetchResult(
+            ok=True,
+            url=url,
+            final_url=url,
+            status_code=200,
+            content_type="text/html",
+            extracted_text=text,
+            title="T",
+            truncated=False,
+            strategy="direct",
+            word_count=300,
+            char_count=len(text),
+            kind="html",
+        )
+
+    return fetch_document
+
+
+def _fetch_many(service: AgentService, monkeypatch: pytest.MonkeyPatch, max_sources: int):
+    captured: dict = {}
+    monkeypatch.setattr(
+        agent_factory, "create_deep_agent", lambda **kwargs: captured.update(kwargs)
+    )
+    service.build_agent("t1", max_sources=max_sources)
+    return next(t for t in captured["tools"] if t.__name__ == "fetch_many")
+
+
+def test_fetch_many_orders_results_and_spends_budget_on_successes(
+    test_settings: Settings, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    calls: list[str] = []
+    monkeypatch.setattr(agent_factory, "fetch_document", _fake_fetch(calls))
+    monkeypatch.setattr(AgentService, "_chat_model", lambda self: None)
+    service = AgentService(dataclasses.replace(test_settings, runs_dir=tmp_path / "runs"))
+    try:
+        fetch_many = _fetch_many(service, monkeypatch, max_sources=2)
+        pool_sizes: list[int] = []
+        real_pool = agent_factory.ThreadPoolExecutor
+
+        def recording_pool(max_workers: int):
+            pool_sizes.append(max_workers)
+            return real_pool(max_workers=max_workers)
+
+        monkeypatch.setattr(agent_factory, "ThreadPoolExecutor", recording_pool)
+        urls = [
+            "ftp://example.com/x",
+            "https://a.example/fail",
+            "https://b.example/fail",
+            "https://c.example/",
+            "HTTPS://C.example/",
+            "https://d.example/",
+            "https://e.example/",
+        ]
+        out = json.loads(fetch_many(urls))
+
+        assert [r["url"] for r in out] == [
+            "ftp://example.com/x",
+            "https://a.example/fail",
+            "https://b.example/fail",
+            "https://c.example/",
+            "https://c.example/",
+            "https://d.example/",
+            "https://e.example/",
+        ]
+        assert out[0]["error"] == "only http(s) urls allowed"
+        assert out[1]["ok"] is False and out[2]["ok"] is False
+        assert out[3]["ok"] is True and out[4] == out[3] and out[5]["ok"] is True
+        assert out[6]["error"] == "source limit reached"
+        assert "ftp://example.com/x" not in calls
+        assert "https://e.example/" not in calls
+        assert calls.count("https://c.example/") == 1
+        assert pool_sizes and max(pool_sizes) <= 2
+
+        bad = json.loads(fetch_many([f"ftp://example.com/{i}" for i in range(50)]))
+        assert len(bad) == 50 and all(r["ok"] is False for r in bad)
+        assert max(pool_sizes) <= 2
+
+        again = json.loads(fetch_many(["https://c.example/"]))
+        assert again[0]["ok"] is True
+        assert calls.count("https://c.example/") == 1
+    finally:
+        service.close()
@@ -42,6 +42,31 @@ def test_artifacts_list_and_download(client):
     assert "test report" in dr.text.lower()
 
 
+def test_artifact_download_honours_etag(client):
+    r = client.post("/run", json={"question": "test question"})
+    tid = r.json()["thread_id"]
+
+    first = client.get(f"/threads/{tid}/artifacts/report.md")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    again = client.get(f"/threads/{tid}/artifacts/report.md", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+
+    for header in (f'"x", W/{etag}', "*"):
+        r = client.get(f"/threads/{tid}/artifacts/report.md", headers={"If-None-Match": header})
+        assert r.status_code == 304
+
+    other = client.get(
+        f"/threads/{tid}/artifacts/report.md", headers={"If-None-Match": f'"x{etag}"'}
+    )
+    assert other.status_code == 200
+
+    missing = client.get(f"/threads/{tid}/artifacts/nope.md")
+    assert missing.status_code == 404
+
+
 def test_artifact_path_traversal_blocked(client):
     r = client.post("/run", json={"question": "test question"})
     tid = r.json()["thread_id"]
@@ -50,4 +75,9 @@ def test_artifact_path_traversal_blocked(client):
     assert bad.status_code in (400, 404)
 
     bad2 = client.get(f"/threads/{tid}/artifacts/%2e%2e/%2e%2e/.env")
-    assert bad2.status_code in (400, 404)
\ No newline at end of file
+    assert bad2.status_code in (400, 404)
+
+
+def test_reserved_thread_ids_are_not_served(client):
+    assert client.get("/threads/_cache/artifacts").status_code == 400
+    assert client.get("/threads/_cache/artifacts/sources/x.json").status_code == 400
@@ -1,10 +1,18 @@
-import pytest
+import shutil
 from pathlib import Path
 
+import orjson
+import pytest
+
+from deep_research_agent import artifacts
 from deep_research_agent.artifacts import (
     ensure_thread_dir,
     artifact_abs_path,
+    ensure_required_artifacts,
+    list_artifacts,
+    load_cached_source,
     safe_thread_id,
+    store_cached_source,
 )
 
 
@@ -15,6 +23,8 @@ def test_safe_thread_id_rejects_bad_ids():
         safe_thread_id("a/b")
     with pytest.raises(ValueError):
         safe_thread_id("a\\b")
+    with pytest.raises(ValueError):
+        safe_thread_id("_cache")
 
 
 def test_artifact_abs_path_blocks_escape(tmp_path: Path):
@@ -26,4 +36,94 @@ def test_artifact_abs_path_blocks_escape(tmp_path: Path):
         artifact_abs_path(runs_dir, tid, "../x")
 
     with pytest.raises(ValueError):
-        artifact_abs_path(runs_dir, tid, "/etc/passwd")
\ No newline at end of file
+        artifact_abs_path(runs_dir, tid, "/etc/passwd")
+
+
+def test_artifact_abs_path_blocks_sibling_prefix_symlink(tmp_path: Path):
+    runs_dir = tmp_path / "runs"
+    td = ensure_thread_dir(runs_dir, "t1")
+    sibling = ensure_thread_dir(runs_dir, "t10")
+    (sibling / "secret.md").write_text("x", encoding="utf-8")
+    (td / "link.md").symlink_to(sibling / "secret.md")
+
+    with pytest.raises(ValueError):
+        artifact_abs_path(runs_dir, "t1", "link.md")
+
+
+def test_cached_source_is_shared_across_threads(tmp_path: Path):
+    runs_dir = tmp_path / "runs"
+    a = ensure_thread_dir(runs_dir, "a") / "sources"
+    b = ensure_thread_dir(runs_dir, "b") / "sources"
+    a.mkdir()
+    b.mkdir()
+
+    meta_a = {"ok": True, "local_path": "runs/a/sources/h.txt"}
+    store_cached_source(runs_dir, a, "h", "text", meta_a)
+    assert "local_path" not in orjson.loads((runs_dir / "_cache" / "h.json").read_bytes())
+    meta = load_cached_source(runs_dir, b, "h", local_path="runs/b/sources/h.txt", ttl_s=60)
+
+    assert meta is not None
+    assert meta["local_path"] == "runs/b/sources/h.txt"
+    assert (b / "h.txt").read_text(encoding="utf-8") == "text"
+    assert load_cached_source(runs_dir, b, "h", local_path="x", ttl_s=0) is None
+
+
+def test_invalid_sources_json_is_reset(tmp_path: Path):
+    runs_dir = tmp_path / "runs"
+    td = ensure_thread_dir(runs_dir, "t")
+    (td / "sources.json").write_text("[1, 2]", encoding="utf-8")
+    assert not any("sources.json" in w for w in ensure_required_artifacts(runs_dir, "t"))
+
+    (td / "sources.json").write_text("[1, 2", encoding="utf-8")
+    warnings = ensure_required_artifacts(runs_dir, "t")
+    assert "Reset sources.json to [] (invalid JSON)." in warnings
+    assert (td / "sources.json").read_text(encoding="utf-8") == "[]\n"
+
+
+def test_thread_dir_memo_recovers_from_deleted_dir(tmp_path: Path):
+    runs_dir = tmp_path / "runs"
+    td = ensure_thread_dir(runs_dir, "t1")
+    (td / "x.md").write_text("x", encoding="utf-8")
+    shutil.rmtree(td)
+
+    assert list_artifacts(runs_dir, "t1") == []
+    shutil.rmtree(td)
+    assert len(ensure_required_artifacts(runs_dir, "t1")) == 4
+    assert (td / "report.md").exists()
+
+
+def test_thread_dir_memo_is_bounded(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(artifacts, "THREAD_DIR_CACHE_SIZE", 2)
+    for tid in ("a", "b", "c"):
+        ensure_thread_dir(tmp_path, tid)
+    assert (str(tmp_path), "a") not in artifacts._known_thread_dirs
+    assert (str(tmp_path), "c") in artifacts._known_thread_dirs
+
+
+def test_valid_sources_memo_is_bounded(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(artifacts, "VALID_SOURCES_CACHE_SIZE", 2)
+    for tid in ("a", "b", "c"):
+        ensure_required_artifacts(tmp_path, tid)
+        ensure_required_artifacts(tmp_path, tid)
+    assert len(artifacts._valid_sources) == 2
+    assert str(tmp_path / "c" / "sources.json") in artifacts._valid_sources
+
+
+def test_failed_write_leaves_no_tmp(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    def boom(*_args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(artifacts, "_fdatasync", boom)
+    with pytest.raises(OSError):
+        artifacts._write_replace(tmp_path / "a.txt", b"data")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_list_artifacts_skips_dangling_links_and_tmp_files(tmp_path: Path):
+    runs_dir = tmp_path / "runs"
+    td = ensure_thread_dir(runs_dir, "t1")
+    (td / "report.md").write_text("r", encoding="utf-8")
+    (td / "gone.md").symlink_to(td / "missing.md")
+    (td / ".notes.md.1.2.tmp").write_text("partial", encoding="utf-8")
+
+    assert [a.path for a in list_artifacts(runs_dir, "t1")] == ["report.md"]
@@ -1,9 +1,7 @@
-from deep_research_agent.api import app
 from fastapi.testclient import TestClient
 
 
-def test_health():
-    client = TestClient(app)
+def test_health(client: TestClient):
     r = client.get("/health")
     assert r.status_code == 200
-    assert r.json()["ok"] is True
\ No newline at end of file
+    assert r.json()["ok"] is True
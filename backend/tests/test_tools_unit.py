@@ -1,4 +1,15 @@
-from deep_research_agent.tools import html_to_text, extract_links, extract_title
+import httpx
+
+from deep_research_agent import tools
+from deep_research_agent.tools import (
+    TRUNC_MARKER,
+    extract_links,
+    extract_title,
+    html_to_text,
+    normalize_url,
+    parse_html,
+    truncate_text,
+)
 
 
 def test_extract_title():
@@ -6,6 +17,12 @@ def test_extract_title():
     assert extract_title(html) == "Hello World"
 
 
+def test_extract_title_other_casings():
+    assert extract_title("<TITLE>Upper</TITLE>") == "Upper"
+    assert extract_title("<Title lang='en'>Mixed</TITLE>") == "Mixed"
+    assert extract_title("<p>no title</p>") is None
+
+
 def test_html_to_text_strips_script_style():
     html = """
     <html>
@@ -36,4 +53,94 @@ def test_extract_links_normalizes_and_filters():
     links = extract_links(html, "https://example.com/base", limit=10)
     assert "https://example.com/a" in links
     assert "https://example.com/b" in links
-    assert all(not l.startswith("mailto:") for l in links)
\ No newline at end of file
+    assert all(not l.startswith("mailto:") for l in links)
+
+
+def test_extract_links_keeps_uppercase_schemes():
+    html = '<a href="HTTP://x.com/a">X</a><a href="MAILTO:a@b.c">M</a>'
+    assert extract_links(html, "https://example.com/") == ["HTTP://x.com/a"]
+    assert tools._extract_links_py(html, "https://example.com/") == ["HTTP://x.com/a"]
+
+
+def test_stdlib_parser_handles_uppercase_markup():
+    html = '<BODY><SCRIPT>alert(1)</SCRIPT><P>Hi</P><A HREF="/up">U</A></BODY>'
+    assert tools._html_to_text_py(html) == "Hi\n\nU"
+    assert tools._extract_links_py(html, "https://example.com/", limit=10) == ["https://example.com/up"]
+
+
+def test_parse_html_matches_stdlib_fallback():
+    html = """
+    <html><head><title> T  1 </title><script>alert(1)</script></head>
+    <body><nav><a href="/nav">N</a></nav>
+    <main><h1>Hello</h1><p>World <b>bold</b> tail</p><a href="/a#x">A</a></main>
+    </body></html>
+    """
+    doc = parse_html(html)
+    assert doc.title == extract_title(html)
+    assert doc.text == tools._html_to_text_py(html)
+    assert extract_links(html, "https://example.com/base", limit=10) == tools._extract_links_py(
+        html, "https://example.com/base", limit=10
+    )
+    assert parse_html(html) is doc
+
+    for html in (
+        "<body><nav><a href='/n'>Home</a> secret nav tail</nav><p>Body text</p></body>",
+        "<body><nav>n<!-- c --> after comment</nav><p>Body</p></body>",
+        "<body><p>a</p><nav>n</nav> kept tail<p>b</p></body>",
+    ):
+        assert parse_html(html).text == tools._html_to_text_py(html)
+
+
+def test_parse_html_handles_prolog_siblings():
+    for prolog in ("<!DOCTYPE html><!-- c -->", '<?xml version="1.0"?>'):
+        html = prolog + '<html><body><p>Hello</p><a href="/a">A</a></body></html>'
+        doc = parse_html(html)
+        assert doc.text == "Hello\n\nA"
+        assert doc.links_raw == ("/a",)
+
+
+def test_parse_html_blank_input():
+    for html in ("", "   \n"):
+        assert parse_html(html) == tools.ParsedDoc(None, "", ())
+        assert html_to_text(html) == ""
+        assert extract_links(html, "https://example.com/") == []
+
+
+def test_normalize_url():
+    assert normalize_url(" HTTPS://Example.COM/a?b=1#frag ") == "https://example.com/a?b=1"
+    assert normalize_url("mailto:test@example.com") is None
+    assert normalize_url("http://[::1") is None
+
+
+def test_fetch_url_blocks_non_http_schemes():
+    assert tools.fetch_url("file:///etc/passwd").startswith("Blocked:")
+    assert tools.fetch_url("ftp://example.com/x").startswith("Blocked:")
+
+
+def test_truncate_text():
+    assert truncate_text("abc", 3) == ("abc", False)
+    assert truncate_text("abcdef", 3) == ("abc" + TRUNC_MARKER, True)
+
+
+def test_create_http_client_pool_limits(monkeypatch):
+    seen: dict = {}
+    real_transport = httpx.HTTPTransport
+
+    def recording_transport(**kwargs):
+        seen.update(kwargs)
+        return real_transport(**kwargs)
+
+    monkeypatch.setattr(httpx, "HTTPTransport", recording_transport)
+    with tools.create_http_client(timeout_s=5.0):
+        pass
+    assert seen["limits"] == httpx.Limits(
+        max_connections=100, max_keepalive_connections=20, keepalive_expiry=30
+    )
+    assert seen["http2"] is True
+
+
+def test_decode_body_falls_back_to_utf8():
+    data = "héllo".encode("utf-8")
+    assert tools._decode_body(data, "text/html; charset=latin-1") == "hÃ©llo"
+    assert tools._decode_body(data, "text/html; charset=bogus") == "héllo"
+    assert tools._decode_body(data, "text/html; charset=idna") == "héllo"